@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[r'F:\gitBash\x-build\x-build-source'],
     binaries=[],
     datas=[],
-    hiddenimports=['builders', 'common', 'builders.cmake_builder', 'builders.user_builder', 'builders.docker_builder'],
+    hiddenimports=['builders', 'common', 'builders.cmake_builder', 'builders.user_builder', 'builders.docker_builder', 'builders.ctest_runner', 'common.common', 'common.build_log', 'common.toolchain_cache', 'common.context_sync', 'common.resource_sampler', 'common.build_history', 'common.packager'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,16 +1,84 @@
 import sys
 import os
+import shutil
 import subprocess
 from pathlib import Path
+from common.build_log import run_logged
+from common.toolchain_cache import ToolchainCache, read_cmake_cache
+from common.packager import ArtifactPackager
+from common.resource_sampler import track
+from builders.ctest_runner import CTestRunner
+
+# 未配置 linkMemoryMB 时，单个链接任务的默认内存估算（MB）
+DEFAULT_LINK_MEMORY_MB = 2048
 
 class CMakeBuilder:
-    def __init__(self, project, platform, compiler, buildType, cflags, lflags):
+    def __init__(self, project, platform, compiler, buildType, cflags, lflags, linkMemoryMB=None, log=None, recorder=None, runTests=False, package=False, packageDir=None, projectJobs=1):
         self.project = project
         self.platform = platform
         self.compiler = compiler
         self.buildType = buildType
         self.cflags = cflags
         self.lflags = lflags
+        self.linkMemoryMB = linkMemoryMB or DEFAULT_LINK_MEMORY_MB
+        self.log = log
+        self.recorder = recorder
+        self.runTests = runTests
+        self.package = package
+        self.packageDir = packageDir
+        # 同时构建的项目数，CPU 和可用内存按项目平分
+        self.projectJobs = max(1, projectJobs or 1)
+
+    def _get_available_memory_mb(self):
+        """从 /proc/meminfo 读取可用内存（MB），无法读取时返回 None"""
+        try:
+            with open("/proc/meminfo", "r") as f:
+                meminfo = {}
+                for line in f:
+                    key, _, value = line.partition(":")
+                    meminfo[key.strip()] = value.strip()
+        except OSError:
+            return None
+
+        # 优先使用 MemAvailable，旧内核没有该字段时退回 MemFree + Cached
+        if "MemAvailable" in meminfo:
+            return int(meminfo["MemAvailable"].split()[0]) // 1024
+        if "MemFree" in meminfo:
+            free_kb = int(meminfo["MemFree"].split()[0])
+            cached_kb = int(meminfo.get("Cached", "0 kB").split()[0])
+            return (free_kb + cached_kb) // 1024
+        return None
+
+    def _get_job_pools(self):
+        """计算 Ninja 编译/链接任务池大小，编译并发按本项目分得的 CPU、链接并发按分得的可用内存推导"""
+        compile_jobs = max(1, (os.cpu_count() or 1) // self.projectJobs)
+        available_mb = self._get_available_memory_mb()
+        if available_mb is None:
+            link_jobs = compile_jobs
+        else:
+            link_jobs = max(1, min(compile_jobs, available_mb // self.projectJobs // self.linkMemoryMB))
+        return compile_jobs, link_jobs
+
+    def _package_artifacts(self, buildDir):
+        """打包本项目安装的文件（install_manifest.txt 中列出的、相对 CMAKE_INSTALL_PREFIX 的路径）
+
+        配置了 packageDir 时改为打包该目录。安装前缀通常是多个项目共用的目录，不能整体打包
+        """
+        files = None
+        packageDir = self.packageDir
+        if not packageDir:
+            entry = read_cmake_cache(os.path.join(buildDir, "CMakeCache.txt")).get("CMAKE_INSTALL_PREFIX")
+            packageDir = entry[1] if entry else None
+            manifest = os.path.join(buildDir, "install_manifest.txt")
+            if not packageDir or not os.path.exists(manifest):
+                print("错误: 无法确定安装前缀或找不到 install_manifest.txt")
+                return False
+            with open(manifest, "r", encoding="utf-8") as f:
+                files = [line.strip() for line in f if line.strip()]
+        print("打包成果物...")
+        if self.log:
+            self.log.set_phase("package")
+        return ArtifactPackager(self.project, packageDir, files=files).package() is not None
 
     def build_project(self):
         """使用新式 CMake 命令构建项目"""
@@ -28,32 +96,75 @@ class CMakeBuilder:
             if not toolchainFile.exists():
                 print(f"错误: 找不到工具链文件: {toolchainFile}")
                 return False
-            subprocess.run([
+            compile_jobs, link_jobs = self._get_job_pools()
+            print(f"任务池: compile={compile_jobs}, link={link_jobs} "
+                  f"(linkMemoryMB={self.linkMemoryMB}, projectJobs={self.projectJobs})")
+            if self.log:
+                self.log.set_phase("configure")
+            configureCmd = [
                 "cmake", 
                 "-S", f"{basePath}/code/{self.project}",
                 "-B", buildDir,
                 "-G", "Ninja",
                 f"-DCMAKE_TOOLCHAIN_FILE={basePath}/config/{self.platform}/{self.platform}-{self.compiler}.cmake",
                 f"-DCMAKE_BUILD_TYPE={self.buildType}",
+                # 编译任务占满本项目分得的 CPU，链接任务单独放入受内存限制的池
+                f"-DCMAKE_JOB_POOLS=compile={compile_jobs};link={link_jobs}",
+                "-DCMAKE_JOB_POOL_COMPILE=compile",
+                "-DCMAKE_JOB_POOL_LINK=link",
                 # 将cflags列表合并成一个字符串，用空格分隔
                 f"-DCMAKE_CXX_FLAGS={' '.join(self.cflags)}" if self.cflags else "",
                 # 将lflags列表合并成一个字符串，用空格分隔
                 f"-DCMAKE_EXE_LINKER_FLAGS={' '.join(self.lflags)}" if self.lflags else "",
-            ], check=True)
+            ]
+            # 全新构建目录用同一工具链缓存的编译器识别结果初始化，跳过编译器识别和 ABI 检测
+            toolchainCache = ToolchainCache(toolchainFile, f"{self.platform}-{self.compiler}")
+            initialCache = toolchainCache.seed(buildDir)
+            with track(self.recorder, self.project, "configure") as sampler:
+                if initialCache:
+                    returnCode = run_logged(configureCmd[:1] + ["-C", initialCache] + configureCmd[1:], self.log,
+                                            on_start=sampler.attach_pid, on_exit=sampler.record_exit)
+                    if returnCode != 0:
+                        print("使用工具链缓存配置失败，清理后不使用缓存重新配置...")
+                        shutil.rmtree(buildDir, ignore_errors=True)
+                        os.makedirs(buildDir, exist_ok=True)
+                        run_logged(configureCmd, self.log, check=True,
+                                   on_start=sampler.attach_pid, on_exit=sampler.record_exit)
+                        # 不使用缓存能配置成功，说明失败是缓存造成的；项目自身的错误不影响其他项目共用的缓存
+                        toolchainCache.invalidate()
+                else:
+                    run_logged(configureCmd, self.log, check=True,
+                               on_start=sampler.attach_pid, on_exit=sampler.record_exit)
+            toolchainCache.capture(buildDir)
 
             # 构建项目
             print("构建项目...")
-            subprocess.run([
-                "cmake",
-                "--build", buildDir,
-                "--parallel", str(os.cpu_count())
-            ], check=True)
+            if self.log:
+                self.log.set_phase("build")
+            with track(self.recorder, self.project, "build") as sampler:
+                run_logged([
+                    "cmake",
+                    "--build", buildDir,
+                    "--parallel", str(compile_jobs)
+                ], self.log, check=True, on_start=sampler.attach_pid, on_exit=sampler.record_exit)
 
             print("install项目...")
-            subprocess.run([
-                "cmake",
-                "--install", buildDir
-            ], check=True)
+            if self.log:
+                self.log.set_phase("install")
+            with track(self.recorder, self.project, "install") as sampler:
+                run_logged([
+                    "cmake",
+                    "--install", buildDir
+                ], self.log, check=True, on_start=sampler.attach_pid, on_exit=sampler.record_exit)
+
+            if self.runTests:
+                print("运行测试...")
+                if not CTestRunner(self.project, buildDir, jobs=compile_jobs, log=self.log).run():
+                    print("测试失败!")
+                    return False
+
+            if self.package and not self._package_artifacts(buildDir):
+                return False
 
             print("构建成功!")
             return True
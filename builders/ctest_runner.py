@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import time
+import xml.etree.ElementTree as ET
+from common.common import STATE_DIR
+from common.build_log import run_logged
+
+TEST_HISTORY_ROOT = os.path.join(STATE_DIR, "tests")
+JUNIT_REPORT_NAME = "test-results.xml"
+# ctest 按此文件中的平均耗时安排 -j 下的启动顺序，耗时长的先启动
+COST_DATA_PATH = os.path.join("Testing", "Temporary", "CTestCostData.txt")
+_CMAKE_REGEX_SPECIAL = re.compile(r"([\^$.\[\]*+?()|\\])")
+
+
+def _cmake_regex_escape(text: str) -> str:
+    return _CMAKE_REGEX_SPECIAL.sub(r"\\\1", text)
+
+
+class CTestRunner:
+    """调用 ctest -j 并行执行测试，用历史耗时预置调度数据让耗时最长的测试先启动，并输出 JUnit 报告"""
+
+    def __init__(self, project, buildDir, jobs=None, log=None):
+        self.project = project
+        self.buildDir = os.path.abspath(buildDir)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.log = log
+        self.historyFile = os.path.abspath(os.path.join(TEST_HISTORY_ROOT, f"{project}.json"))
+        self.reportFile = os.path.join(self.buildDir, JUNIT_REPORT_NAME)
+        self.costDataFile = os.path.join(self.buildDir, COST_DATA_PATH)
+
+    def _load_history(self):
+        try:
+            with open(self.historyFile, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"durations": {}, "failed": []}
+
+    def _save_history(self, history):
+        os.makedirs(os.path.dirname(self.historyFile), exist_ok=True)
+        with open(self.historyFile, "w") as f:
+            json.dump(history, f, indent=2)
+
+    def _seed_cost_data(self, durations):
+        """把记录的耗时补进 CTestCostData.txt，构建目录被清理后 ctest 仍能按历史耗时调度"""
+        costs = {}
+        failed = []
+        try:
+            with open(self.costDataFile, "r", encoding="utf-8") as f:
+                inFailedSection = False
+                for line in f.read().splitlines():
+                    if line == "---":
+                        inFailedSection = True
+                    elif inFailedSection:
+                        failed.append(line)
+                    elif line:
+                        parts = line.split(" ")
+                        if len(parts) == 3:
+                            costs[parts[0]] = (parts[1], parts[2])
+        except OSError:
+            pass
+
+        added = 0
+        for name, duration in durations.items():
+            # ctest 以空格分隔该文件的字段，名称带空格的测试无法记录
+            if name not in costs and " " not in name:
+                costs[name] = ("1", f"{duration:g}")
+                added += 1
+        if not added:
+            return
+        os.makedirs(os.path.dirname(self.costDataFile), exist_ok=True)
+        with open(self.costDataFile, "w", encoding="utf-8") as f:
+            for name, (count, cost) in costs.items():
+                f.write(f"{name} {count} {cost}\n")
+            f.write("---\n")
+            for name in failed:
+                f.write(f"{name}\n")
+
+    def _read_junit(self):
+        """读取 ctest --output-junit 生成的报告，返回 [(名称, 状态, 耗时)]"""
+        results = []
+        for case in ET.parse(self.reportFile).getroot().iter("testcase"):
+            if case.find("failure") is not None or case.find("error") is not None:
+                status = "failed"
+            elif case.find("skipped") is not None or case.get("status") in ("disabled", "notrun"):
+                status = "skipped"
+            else:
+                status = "passed"
+            results.append((case.get("name"), status, float(case.get("time") or 0.0)))
+        return results
+
+    def run(self, rerunFailed=False):
+        """执行测试，全部通过返回 True
+
+        FIXTURES_*、DEPENDS、RUN_SERIAL、RESOURCE_LOCK、PROCESSORS 和 TIMEOUT 等测试属性由 ctest 自己处理
+        """
+        if not os.path.exists(os.path.join(self.buildDir, "CTestTestfile.cmake")):
+            print(f"未找到测试: {self.buildDir} 中没有 CTestTestfile.cmake")
+            return True
+        if self.log:
+            self.log.set_phase("test")
+
+        history = self._load_history()
+        cmd = ["ctest", "-j", str(self.jobs), "--output-on-failure", "--output-junit", self.reportFile]
+        if rerunFailed:
+            failed = history.get("failed", [])
+            if not failed:
+                print("没有上次失败的测试需要重跑")
+                return True
+            # 按历史记录筛选而不用 ctest --rerun-failed，构建目录被清理后仍然有效
+            cmd += ["-R", "^(" + "|".join(_cmake_regex_escape(name) for name in failed) + ")$"]
+        self._seed_cost_data(history.get("durations", {}))
+        print(f"执行测试，并发数 {self.jobs}")
+
+        if os.path.exists(self.reportFile):
+            os.remove(self.reportFile)
+        start = time.time()
+        return_code = run_logged(cmd, self.log, cwd=self.buildDir)
+        elapsed = time.time() - start
+
+        if not os.path.exists(self.reportFile):
+            print(f"ctest 未生成测试报告，退出码: {return_code}")
+            return False
+        results = self._read_junit()
+        durations = history.get("durations", {})
+        failedNames = set(history.get("failed", [])) if rerunFailed else set()
+        for name, status, duration in results:
+            if status != "skipped":
+                durations[name] = round(duration, 3)
+            if status == "failed":
+                failedNames.add(name)
+            else:
+                failedNames.discard(name)
+        self._save_history({"durations": durations, "failed": sorted(failedNames)})
+
+        failures = [name for name, status, _ in results if status == "failed"]
+        print(f"测试完成: {len(results) - len(failures)}/{len(results)} 通过，用时 {elapsed:.2f}s，报告: {self.reportFile}")
+        if failures:
+            print(f"失败的测试: {failures}")
+        return return_code == 0 and not failures
@@ -5,9 +5,12 @@ import docker
 import shutil
 from docker.errors import ImageNotFound, ContainerError, APIError
 from typing import Dict, Any, Optional, Union
+from common.context_sync import ContextSync
+from common.resource_sampler import track, wait_process
+from common.packager import ArtifactPackager
 
 class DockerBuilder:
-    def __init__(self, project, dockerfile, dockerImage, context, dockerBuildCmd, resultDir, host_output_dir=None, container_name=None):
+    def __init__(self, project, dockerfile, dockerImage, context, dockerBuildCmd, resultDir, host_output_dir=None, container_name=None, log=None, contextSync=None, recorder=None, package=False):
         self.project = project
         self.dockerfile = dockerfile
         self.dockerImage = dockerImage
@@ -21,6 +24,12 @@ class DockerBuilder:
         self.container_name = container_name or f"{project}_{dockerImage.replace(':', '_')}"
         self.client = None
         self.container = None
+        self.log = log
+        self.recorder = recorder
+        self.package = package
+        # contextSync 为 "volume" 时源码增量同步到 Docker 卷，默认 "mount" 直接挂载上下文目录
+        self.contextSync = contextSync or "mount"
+        self.sync = ContextSync(project, context, dockerImage, resultDir) if self.contextSync == "volume" else None
 
     def _init_docker_client(self):
         """初始化Docker客户端，增加重试机制"""
@@ -140,9 +149,10 @@ class DockerBuilder:
             echo "build success, exit code: $BUILD_EXIT_CODE"
             exit $BUILD_EXIT_CODE
             """
+            workspace_mount = self.sync.mount if self.sync else f'{os.path.abspath(self.context)}:/workspace'
             docker_cmd = [
                 'docker', 'run', '--rm',
-                '-v', f'{os.path.abspath(self.context)}:/workspace',
+                '-v', workspace_mount,
                 '-w', '/workspace',
                 '--entrypoint', '',
                 # 修改关键：DISPLAY 环境变量
@@ -157,28 +167,37 @@ class DockerBuilder:
                 self.dockerImage,
                 'sh', '-c', shell_script
             ]
+            # 资源采样需要通过容器名调用 docker stats
+            run_name = f"{self.container_name}_run"
+            if self.recorder:
+                docker_cmd[3:3] = ['--name', run_name]
 
             print(f"执行一次性构建命令: {' '.join(docker_cmd)}")
+            if self.log:
+                self.log.set_phase("docker-run")
 
-            process = subprocess.Popen(
-                docker_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                bufsize=1
-            )
-
+            with track(self.recorder, self.project, "docker-run") as sampler:
+                process = subprocess.Popen(
+                    docker_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    encoding='utf-8',
+                    bufsize=1
+                )
+                sampler.attach_container(run_name)
 
-            # 实时读取输出
-            print("命令输出:")
-            # 直接迭代输出行，更Pythonic的方式
-            for raw_output in iter(process.stdout.readline, ''):
-                output_decoded = raw_output.strip()
-                if output_decoded:
-                    print(f"[输出] {output_decoded}")
+                # 实时读取输出
+                print("命令输出:")
+                # 直接迭代输出行，更Pythonic的方式
+                for raw_output in iter(process.stdout.readline, ''):
+                    output_decoded = raw_output.strip()
+                    if output_decoded:
+                        print(f"[输出] {output_decoded}")
+                        if self.log:
+                            self.log.write_line(output_decoded)
 
-            exit_code = process.wait()
+                exit_code = process.wait()
 
             if exit_code == 0:
                 print("✅ 一次性构建成功完成，容器已自动退出")
@@ -261,6 +280,8 @@ class DockerBuilder:
 
             print(f"执行命令行: {' '.join(cmd)}")
             print(f"工作目录: {os.getcwd()}")
+            if self.log:
+                self.log.set_phase("docker-build")
 
             # 执行命令并实时输出
             process = subprocess.Popen(
@@ -281,6 +302,8 @@ class DockerBuilder:
                     break
                 if output:
                     print(output.strip())
+                    if self.log:
+                        self.log.write_line(output)
 
             return_code = process.wait()
 
@@ -301,6 +324,8 @@ class DockerBuilder:
             # 1. 复制文件到容器
             # if not self._copy_files_to_container(container):
             #     return False
+            if self.sync and not self.sync.push():
+                return False
             # 2. 启动容器
             if not self._start_container_with_realtime_output(container):
                 return False
@@ -320,6 +345,8 @@ class DockerBuilder:
             
             if True:
                 print("构建完成，开始复制成果物...")
+                if self.sync and not self.sync.pull():
+                    print("⚠️ 从源码卷拉取成果物失败")
                 copy_success = self._copy_artifacts_direct_mount()
                 
                 # 复制成果物是构建流程的重要部分，但不应影响构建本身的成功状态
@@ -329,6 +356,11 @@ class DockerBuilder:
                     # 这里我们继续返回构建成功，但记录复制问题
                 else:
                     print("✅ 构建和成果物复制均完成")
+                    if self.package:
+                        if self.log:
+                            self.log.set_phase("package")
+                        if ArtifactPackager(self.project, self.host_output_dir).package() is None:
+                            print("⚠️ 成果物打包失败")
             else:
                 print("❌ 构建失败，跳过成果物复制")
             return True
@@ -375,43 +407,51 @@ class DockerBuilder:
                 print(f"错误：上下文目录不存在: {self.context}")
                 return False
                 
-            os.chdir(self.context)
-            print(f"切换到目录: {os.getcwd()}")
+            # 通过 cwd 参数指定工作目录，不修改进程全局的当前目录，便于多个项目并行构建
+            print(f"工作目录: {os.path.abspath(self.context)}")
             
             if not self.dockerBuildCmd:
                 self.dockerBuildCmd = f"./build.exe {self.project}"
             
             print(f"执行构建命令: {self.dockerBuildCmd}")
             print("开始实时输出:")
+            if self.log:
+                self.log.set_phase("host-build")
             
-            # 使用subprocess.Popen实现实时输出
-            if isinstance(self.dockerBuildCmd, str):
-                process = subprocess.Popen(
-                    self.dockerBuildCmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-            else:
-                process = subprocess.Popen(
-                    self.dockerBuildCmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-            
-            # 实时读取输出
-            with process:
-                for line in process.stdout:
-                    print(f"[构建输出] {line.strip()}")
-                
-                process.wait()
-                return_code = process.returncode
+            with track(self.recorder, self.project, "host-build") as sampler:
+                # 使用subprocess.Popen实现实时输出
+                if isinstance(self.dockerBuildCmd, str):
+                    process = subprocess.Popen(
+                        self.dockerBuildCmd,
+                        shell=True,
+                        cwd=self.context,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        bufsize=1,
+                        universal_newlines=True
+                    )
+                else:
+                    process = subprocess.Popen(
+                        self.dockerBuildCmd,
+                        cwd=self.context,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        bufsize=1,
+                        universal_newlines=True
+                    )
+                sampler.attach_pid(process.pid)
+
+                # 实时读取输出
+                with process:
+                    for line in process.stdout:
+                        print(f"[构建输出] {line.strip()}")
+                        if self.log:
+                            self.log.write_line(line)
+
+                    return_code, usage = wait_process(process)
+                    sampler.record_exit(usage)
             
             if return_code == 0:
                 print("✅ 宿主机构建成功完成!")
@@ -426,8 +466,6 @@ class DockerBuilder:
         except Exception as e:
             print(f"❌ 执行过程中发生错误: {e}")
             return False
-        finally:
-            os.chdir(original_cwd)
 
     def _build_in_docker(self):
         """在Docker环境中构建项目"""
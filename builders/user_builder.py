@@ -1,25 +1,201 @@
 import sys
 import os
-import subprocess
+import glob
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from common.common import STATE_DIR
+from common.build_log import run_logged
+from common.resource_sampler import track
 
 class UserBuilder:
-    def __init__(self, project, userBuildCmd):
+    def __init__(self, project, userBuildCmd, log=None, recorder=None):
         self.project = project
         self.userBuildCmd = userBuildCmd
+        self.log = log
+        self.recorder = recorder
+        # 记录每个步骤上次成功时的输入指纹，用于跳过未变化的步骤
+        self.stampFile = os.path.abspath(os.path.join(STATE_DIR, "steps", f"{project}.json"))
+        self._stampLock = threading.Lock()
 
+    def _parse_steps(self):
+        """将 userBuildCmd 统一解析为步骤列表，兼容单条命令的旧格式"""
+        cmd = self.userBuildCmd
+        if isinstance(cmd, str) or (isinstance(cmd, list) and all(isinstance(c, str) for c in cmd)):
+            return [{"name": "build", "cmd": cmd, "dependsOn": [], "cwd": None,
+                     "env": {}, "inputs": [], "outputs": []}]
+
+        steps = []
+        for i, step in enumerate(cmd):
+            if not isinstance(step, dict) or "cmd" not in step:
+                raise ValueError(f"userBuildCmd 第 {i} 项必须是包含 cmd 的对象")
+            steps.append({
+                "name": step.get("name", f"step{i}"),
+                "cmd": step["cmd"],
+                "dependsOn": step.get("dependsOn", []),
+                "cwd": step.get("cwd"),
+                "env": step.get("env", {}),
+                "inputs": step.get("inputs", []),
+                "outputs": step.get("outputs", []),
+            })
+
+        names = [s["name"] for s in steps]
+        if len(set(names)) != len(names):
+            raise ValueError(f"userBuildCmd 步骤名称重复: {names}")
+        for step in steps:
+            for dep in step["dependsOn"]:
+                if dep not in names:
+                    raise ValueError(f"步骤 {step['name']} 依赖不存在的步骤: {dep}")
+        self._check_cycles(steps)
+        return steps
+
+    def _check_cycles(self, steps):
+        """检查步骤依赖中是否存在环"""
+        deps = {s["name"]: s["dependsOn"] for s in steps}
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"userBuildCmd 步骤存在循环依赖: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in deps[name]:
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in deps:
+            visit(name, [])
+
+    def _match_files(self, cwd, patterns):
+        """展开输入/输出声明（相对步骤工作目录的 glob），目录按其中的文件展开"""
+        files = set()
+        for pattern in patterns:
+            for path in glob.glob(os.path.join(cwd, pattern), recursive=True):
+                if os.path.isdir(path):
+                    for root, _, names in os.walk(path):
+                        for name in names:
+                            files.add(os.path.join(root, name))
+                else:
+                    files.add(path)
+        return sorted(files)
+
+    def _fingerprint(self, step, cwd):
+        """根据命令、环境变量和输入文件的大小/修改时间计算指纹"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps([step["cmd"], step["env"]], sort_keys=True).encode("utf-8"))
+        for path in self._match_files(cwd, step["inputs"]):
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, cwd)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load_stamps(self):
+        try:
+            with open(self.stampFile, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_stamp(self, name, fingerprint):
+        with self._stampLock:
+            stamps = self._load_stamps()
+            stamps[name] = fingerprint
+            os.makedirs(os.path.dirname(self.stampFile), exist_ok=True)
+            with open(self.stampFile, "w") as f:
+                json.dump(stamps, f, indent=2)
+
+    def _run_step(self, step, codeDir, stamps, forceRun):
+        """执行单个步骤，返回 (是否成功, 是否实际执行)"""
+        name = step["name"]
+        cwd = os.path.normpath(os.path.join(codeDir, step["cwd"])) if step["cwd"] else codeDir
+        if not os.path.isdir(cwd):
+            print(f"[{name}] 错误：工作目录不存在 {cwd}")
+            return False, True
+
+        fingerprint = self._fingerprint(step, cwd) if step["inputs"] else None
+        if fingerprint and not forceRun and stamps.get(name) == fingerprint:
+            if all(glob.glob(os.path.join(cwd, pattern), recursive=True) for pattern in step["outputs"]):
+                print(f"[{name}] 输入未变化，跳过")
+                return True, False
+
+        env = None
+        if step["env"]:
+            env = dict(os.environ)
+            env.update({key: str(value) for key, value in step["env"].items()})
+
+        print(f"[{name}] 执行: {step['cmd']} (cwd={cwd})")
+        with track(self.recorder, self.project, name) as sampler:
+            return_code = run_logged(step["cmd"], self.log, prefix=f"[{name}] ", cwd=cwd, env=env,
+                                     shell=isinstance(step["cmd"], str), on_start=sampler.attach_pid,
+                                     on_exit=sampler.record_exit)
+        if return_code != 0:
+            print(f"[{name}] 失败，退出码: {return_code}")
+            return False, True
+        if fingerprint:
+            # 以执行后的状态重新计算，避免步骤修改自身输入后下次仍然重跑
+            self._save_stamp(name, self._fingerprint(step, cwd))
+        return True, True
 
     def build_project(self):
-        """使用自定义构建命令构建项目"""
+        """使用自定义构建命令构建项目，无依赖关系的步骤并行执行"""
         print(f"自定义构建命令: {self.userBuildCmd}")
         basePath = os.path.dirname(sys.executable)
         codeDir = f"code/{self.project}"
         codeDir = os.path.join(basePath, codeDir)
 
         # 检查目录是否存在
-        if os.path.exists(codeDir) and os.path.isdir(codeDir):
-            os.chdir(codeDir)
-            print(f"已切换到项目目录: {os.getcwd()}")
-        else:
+        if not (os.path.exists(codeDir) and os.path.isdir(codeDir)):
             print(f"错误：项目目录不存在 {codeDir}")
-            # 这里应该进行错误处理，例如return False或抛出异常
-        subprocess.run(self.userBuildCmd, check=True)
\ No newline at end of file
+            return False
+
+        try:
+            steps = self._parse_steps()
+        except ValueError as e:
+            print(f"错误：{e}")
+            return False
+
+        if self.log:
+            self.log.set_phase("user")
+        stamps = self._load_stamps()
+        pending = {step["name"]: step for step in steps}
+        executed = set()
+        done = set()
+        failed = False
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            while pending or running:
+                if not failed:
+                    for name, step in list(pending.items()):
+                        if all(dep in done for dep in step["dependsOn"]):
+                            # 依赖步骤本次实际执行过时，当前步骤也必须重新执行
+                            forceRun = any(dep in executed for dep in step["dependsOn"])
+                            future = executor.submit(self._run_step, step, codeDir, stamps, forceRun)
+                            running[future] = name
+                            del pending[name]
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        success, ran = future.result()
+                    except Exception as e:
+                        print(f"[{name}] 执行错误: {e}")
+                        success, ran = False, True
+                    if ran:
+                        executed.add(name)
+                    if success:
+                        done.add(name)
+                    else:
+                        failed = True
+
+        if failed:
+            skipped = [name for name in pending]
+            if skipped:
+                print(f"以下步骤因前序失败未执行: {skipped}")
+            print("自定义构建失败")
+            return False
+        print("自定义构建成功!")
+        return True
@@ -0,0 +1,64 @@
+import os
+import json
+import heapq
+import threading
+from typing import Dict, List, Tuple
+
+from common.common import STATE_DIR
+
+BUILD_HISTORY_FILE = os.path.join(STATE_DIR, "build_history.json")
+# 每个项目保留的最近成功构建耗时条数，估算值取其平均
+HISTORY_SIZE = 5
+DEFAULT_BUILD_ESTIMATE = 60.0
+
+
+class BuildHistory:
+    """记录各项目的构建耗时，用于估算和安排构建顺序"""
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or BUILD_HISTORY_FILE)
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, project: str, duration: float, success: bool):
+        """记录一次构建耗时，失败的构建不计入估算"""
+        if not success:
+            return
+        with self._lock:
+            durations = self.data.setdefault(project, {}).setdefault("durations", [])
+            durations.append(round(duration, 3))
+            del durations[:-HISTORY_SIZE]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.data, f, indent=2)
+
+    def has_history(self, project: str) -> bool:
+        return bool(self.data.get(project, {}).get("durations"))
+
+    def estimate(self, project: str, default: float = DEFAULT_BUILD_ESTIMATE) -> float:
+        durations = self.data.get(project, {}).get("durations")
+        if not durations:
+            return default
+        return sum(durations) / len(durations)
+
+
+def plan_builds(projects: List[str], history: BuildHistory, default: float = DEFAULT_BUILD_ESTIMATE,
+                jobs: int = 1, longestFirst: bool = True) -> Tuple[List[Tuple[str, float]], float]:
+    """返回 [(项目, 估算耗时)] 的构建顺序和 jobs 个并行槽位下预测的总耗时"""
+    order = [(project, history.estimate(project, default)) for project in projects]
+    if longestFirst:
+        # sorted 是稳定排序，估算相同的项目保持配置文件中的顺序
+        order = sorted(order, key=lambda item: -item[1])
+
+    # 模拟按顺序把项目分配给最先空闲的槽位
+    slots = [0.0] * max(1, jobs)
+    for _, estimate in order:
+        heapq.heappush(slots, heapq.heappop(slots) + estimate)
+    return order, max(slots)
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import gzip
+import time
+import threading
+import subprocess
+from typing import Dict, Iterator, List, Optional
+
+from common.common import STATE_DIR
+from common.resource_sampler import wait_process
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_ROOT = os.path.join(STATE_DIR, "logs")
+# 每个独立压缩帧包含的行数，读取诊断信息时只需解压命中的帧
+FRAME_LINES = 1000
+DEFAULT_MAX_RUNS = 20
+DEFAULT_MAX_SIZE_MB = 500
+
+ERROR_PATTERN = re.compile(r"\berror\b|错误|失败|\bFAILED\b|❌", re.IGNORECASE)
+WARNING_PATTERN = re.compile(r"\bwarning\b|警告|⚠️", re.IGNORECASE)
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _log_dir(project: str) -> str:
+    return os.path.join(LOG_ROOT, project)
+
+
+def _run_paths(log_dir: str, run: int, codec: str):
+    return (os.path.join(log_dir, f"run-{run:05d}.log.{codec}"),
+            os.path.join(log_dir, f"run-{run:05d}.idx.json"))
+
+
+class BuildLog:
+    """按项目、按次写入的流式压缩构建日志，附带错误/警告行索引"""
+
+    def __init__(self, project, max_runs=None, max_size_mb=None):
+        self.project = project
+        self.max_runs = max_runs or DEFAULT_MAX_RUNS
+        self.max_size_mb = max_size_mb or DEFAULT_MAX_SIZE_MB
+        # 使用绝对路径，避免构建过程中切换工作目录后写错位置
+        self.log_dir = os.path.abspath(_log_dir(project))
+        self.codec = "zst" if zstandard else "gz"
+        self.run = None
+        self.path = None
+        self.index_path = None
+        self.success = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._line_count = 0
+        self._frames = []
+        self._diagnostics = []
+        self._phases = []
+        self._started = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.success is None:
+            self.success = False
+        self.close()
+        return False
+
+    def open(self):
+        """创建本次运行的日志文件"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        runs = _list_runs(self.log_dir)
+        self.run = (runs[-1] + 1) if runs else 1
+        self.path, self.index_path = _run_paths(self.log_dir, self.run, self.codec)
+        self._file = open(self.path, "wb")
+        self._started = time.time()
+        print(f"构建日志: {self.path}")
+
+    def set_phase(self, phase: str):
+        """标记后续输出所属的构建阶段"""
+        with self._lock:
+            self._phases.append({"name": phase, "line": self._line_count})
+
+    def write_line(self, line: str):
+        """写入一行输出，并记录错误/警告所在行号"""
+        if self._file is None:
+            return
+        line = line.rstrip("\r\n")
+        with self._lock:
+            if ERROR_PATTERN.search(line):
+                self._diagnostics.append({"line": self._line_count, "kind": "error"})
+            elif WARNING_PATTERN.search(line):
+                self._diagnostics.append({"line": self._line_count, "kind": "warning"})
+            self._buffer.append(line)
+            self._line_count += 1
+            if len(self._buffer) >= FRAME_LINES:
+                self._flush_frame()
+
+    def _flush_frame(self):
+        if not self._buffer:
+            return
+        data = ("\n".join(self._buffer) + "\n").encode("utf-8", errors="replace")
+        compressed = _compress(data, self.codec)
+        self._frames.append({
+            "offset": self._file.tell(),
+            "length": len(compressed),
+            "firstLine": self._line_count - len(self._buffer),
+            "lines": len(self._buffer),
+        })
+        self._file.write(compressed)
+        self._file.flush()
+        self._buffer = []
+
+    def close(self):
+        """写出剩余内容和索引，并按保留策略清理旧日志"""
+        if self._file is None:
+            return
+        with self._lock:
+            self._flush_frame()
+            self._file.close()
+            self._file = None
+        index = {
+            "project": self.project,
+            "run": self.run,
+            "codec": self.codec,
+            "started": self._started,
+            "finished": time.time(),
+            "success": self.success,
+            "lines": self._line_count,
+            "phases": self._phases,
+            "frames": self._frames,
+            "diagnostics": self._diagnostics,
+        }
+        with open(self.index_path, "w") as f:
+            json.dump(index, f)
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """按次数和总大小保留最近的日志，当前这次始终保留"""
+        runs = _list_runs(self.log_dir)
+        sizes = {}
+        for run in runs:
+            total = 0
+            for path in _existing_run_files(self.log_dir, run):
+                total += os.path.getsize(path)
+            sizes[run] = total
+        total_size = sum(sizes.values())
+        max_bytes = self.max_size_mb * 1024 * 1024
+        for run in runs:
+            if run == self.run:
+                break
+            if len(runs) <= self.max_runs and total_size <= max_bytes:
+                break
+            for path in _existing_run_files(self.log_dir, run):
+                os.remove(path)
+            runs = [r for r in runs if r != run]
+            total_size -= sizes[run]
+
+
+def _existing_run_files(log_dir: str, run: int) -> List[str]:
+    prefix = f"run-{run:05d}."
+    if not os.path.isdir(log_dir):
+        return []
+    return [os.path.join(log_dir, name) for name in os.listdir(log_dir) if name.startswith(prefix)]
+
+
+def _list_runs(log_dir: str) -> List[int]:
+    if not os.path.isdir(log_dir):
+        return []
+    runs = set()
+    for name in os.listdir(log_dir):
+        match = re.match(r"run-(\d+)\.", name)
+        if match:
+            runs.add(int(match.group(1)))
+    return sorted(runs)
+
+
+def list_runs(project: str) -> List[int]:
+    """返回项目已有的日志运行编号（升序）"""
+    return _list_runs(_log_dir(project))
+
+
+def load_index(project: str, run: Optional[int] = None) -> Optional[Dict]:
+    """读取指定运行（默认最近一次）的日志索引"""
+    runs = list_runs(project)
+    if not runs:
+        return None
+    if run is None:
+        run = runs[-1]
+    log_dir = _log_dir(project)
+    for codec in ("zst", "gz"):
+        log_path, index_path = _run_paths(log_dir, run, codec)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            index["path"] = _run_paths(log_dir, run, index["codec"])[0]
+            return index
+        if os.path.exists(log_path):
+            # 进程中途退出时没有索引，只能顺序读取
+            return {"project": project, "run": run, "codec": codec, "path": log_path,
+                    "frames": None, "diagnostics": None}
+    return None
+
+
+def _check_codec(codec: str):
+    if codec == "zst" and zstandard is None:
+        raise RuntimeError("读取 .zst 日志需要安装 zstandard 模块")
+
+
+def read_log_lines(index: Dict) -> Iterator[str]:
+    """逐帧解压并返回完整日志内容"""
+    codec = index["codec"]
+    _check_codec(codec)
+    if index.get("frames") is None:
+        if codec == "zst":
+            with open(index["path"], "rb") as f:
+                reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+                data = reader.read()
+        else:
+            with gzip.open(index["path"], "rb") as f:
+                data = f.read()
+        yield from data.decode("utf-8", errors="replace").splitlines()
+        return
+    with open(index["path"], "rb") as f:
+        for frame in index["frames"]:
+            f.seek(frame["offset"])
+            data = _decompress(f.read(frame["length"]), codec)
+            yield from data.decode("utf-8", errors="replace").splitlines()
+
+
+def read_diagnostics(index: Dict, kinds=("error", "warning")) -> Iterator[Dict]:
+    """只解压包含错误/警告行的帧，返回对应的诊断行"""
+    codec = index["codec"]
+    _check_codec(codec)
+    if index.get("diagnostics") is None:
+        for line_no, line in enumerate(read_log_lines(index)):
+            if ERROR_PATTERN.search(line):
+                kind = "error"
+            elif WARNING_PATTERN.search(line):
+                kind = "warning"
+            else:
+                continue
+            if kind in kinds:
+                yield {"line": line_no, "kind": kind, "text": line}
+        return
+
+    wanted = [d for d in index["diagnostics"] if d["kind"] in kinds]
+    frames = index["frames"]
+    frame_pos = 0
+    cached_frame = None
+    cached_lines = []
+    with open(index["path"], "rb") as f:
+        for diagnostic in wanted:
+            # 诊断行号递增，帧也按行号排序，顺序推进即可
+            while frame_pos < len(frames) and \
+                    frames[frame_pos]["firstLine"] + frames[frame_pos]["lines"] <= diagnostic["line"]:
+                frame_pos += 1
+            if frame_pos >= len(frames):
+                break
+            if cached_frame != frame_pos:
+                frame = frames[frame_pos]
+                f.seek(frame["offset"])
+                data = _decompress(f.read(frame["length"]), codec)
+                cached_lines = data.decode("utf-8", errors="replace").splitlines()
+                cached_frame = frame_pos
+            text = cached_lines[diagnostic["line"] - frames[frame_pos]["firstLine"]]
+            yield {"line": diagnostic["line"], "kind": diagnostic["kind"], "text": text}
+
+
+def run_logged(cmd, log: Optional[BuildLog] = None, prefix: str = "", check: bool = False,
+               cwd=None, env=None, shell: bool = False, on_start=None, on_exit=None) -> int:
+    """执行命令，实时打印输出并写入构建日志，返回退出码
+
+    on_start 在进程启动后收到其 pid，on_exit 在进程退出后收到其 rusage（不支持时为 None）
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1,
+        cwd=cwd,
+        env=env,
+        shell=shell
+    )
+    if on_start:
+        on_start(process.pid)
+    with process:
+        for raw_line in process.stdout:
+            line = raw_line.rstrip("\r\n")
+            print(f"{prefix}{line}")
+            if log:
+                log.write_line(line)
+        return_code, usage = wait_process(process)
+    if on_exit:
+        on_exit(usage)
+    if check and return_code != 0:
+        raise subprocess.CalledProcessError(return_code, cmd)
+    return return_code
@@ -2,6 +2,9 @@
 import json
 from typing import Dict, List, Optional
 
+# 构建器自身状态（日志、缓存、历史记录）的存放目录，不随 dclean 清理
+STATE_DIR = ".xbuild"
+
 
 class ConfigManager:
     def __init__(self):
@@ -111,4 +114,65 @@ class ConfigManager:
         config = self.get_config(name)
         if config:
             return config.get('resultDir', [])
-        return []
\ No newline at end of file
+        return []
+
+    def get_linkMemoryMB(self, name: str) -> int:
+        """获取单个链接任务的内存估算（MB），0 表示使用默认值"""
+        config = self.get_config(name)
+        if config:
+            return config.get('linkMemoryMB', 0)
+        return 0
+
+    def get_logRetention(self) -> Dict:
+        """获取构建日志保留策略（全局配置）"""
+        if not isinstance(self.data, dict):
+            return {}
+        return self.data.get('logRetention', {})
+
+    def get_contextSync(self, name: str) -> str:
+        config = self.get_config(name)
+        if config:
+            return config.get('contextSync', "mount")
+        return "mount"
+
+    def get_resourceSampling(self) -> Dict:
+        """获取资源采样配置（全局配置），例如 {"enabled": true, "interval": 1.0}"""
+        if not isinstance(self.data, dict):
+            return {}
+        return self.data.get('resourceSampling', {})
+
+    def get_runTests(self, name: str) -> bool:
+        config = self.get_config(name)
+        if config:
+            return config.get('runTests', False)
+        return False
+
+    def get_projectJobs(self) -> int:
+        """同时构建的项目数（全局配置），默认逐个构建"""
+        if not isinstance(self.data, dict):
+            return 1
+        return self.data.get('projectJobs', 1)
+
+    def get_defaultBuildEstimate(self) -> float:
+        """没有历史记录的项目的估算构建耗时（秒，全局配置）"""
+        if not isinstance(self.data, dict):
+            return 60.0
+        return self.data.get('defaultBuildEstimate', 60.0)
+
+    def get_buildOrder(self) -> str:
+        """构建顺序（全局配置）："longest-first" 按历史耗时从长到短，"config" 按配置文件顺序"""
+        if not isinstance(self.data, dict):
+            return "longest-first"
+        return self.data.get('buildOrder', "longest-first")
+
+    def get_package(self, name: str) -> bool:
+        config = self.get_config(name)
+        if config:
+            return config.get('package', False)
+        return False
+
+    def get_packageDir(self, name: str) -> str:
+        config = self.get_config(name)
+        if config:
+            return config.get('packageDir', "")
+        return ""
@@ -0,0 +1,190 @@
+import io
+import os
+import re
+import json
+import tarfile
+import subprocess
+from typing import Dict, List, Tuple
+
+from common.common import STATE_DIR
+
+SYNC_ROOT = os.path.join(STATE_DIR, "sync")
+CONTAINER_WORKSPACE = "/workspace"
+# 容器内记录删除列表和上次拉取时间的文件
+DELETED_LIST_NAME = ".xbuild-deleted"
+PULL_STAMP_NAME = ".xbuild-pulled"
+PULL_LIST_NAME = ".xbuild-pulled-files"
+
+
+class ContextSync:
+    """将构建上下文增量同步到每个项目独立的 Docker 卷，替代直接挂载宿主机目录"""
+
+    def __init__(self, project, context, dockerImage, resultDir=None):
+        self.project = project
+        self.context = os.path.abspath(context)
+        self.dockerImage = dockerImage
+        self.resultDir = resultDir.replace("\\", "/").strip("/") if resultDir else None
+        self.volume = "xbuild-src-" + re.sub(r"[^a-zA-Z0-9_.-]", "_", project)
+        self.manifestFile = os.path.abspath(os.path.join(SYNC_ROOT, f"{project}.json"))
+
+    @property
+    def mount(self) -> str:
+        """docker run -v 使用的挂载参数"""
+        return f"{self.volume}:{CONTAINER_WORKSPACE}"
+
+    def _load_manifest(self) -> Dict[str, list]:
+        try:
+            with open(self.manifestFile, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("volume") != self.volume:
+            return {}
+        return manifest.get("files", {})
+
+    def _save_manifest(self, files: Dict[str, list]):
+        os.makedirs(os.path.dirname(self.manifestFile), exist_ok=True)
+        with open(self.manifestFile, "w") as f:
+            json.dump({"volume": self.volume, "files": files}, f)
+
+    def _is_excluded(self, rel: str) -> bool:
+        # 构建器状态目录和成果物目录不回传到容器
+        if rel == STATE_DIR or rel.startswith(STATE_DIR + "/"):
+            return True
+        if self.resultDir and (rel == self.resultDir or rel.startswith(self.resultDir + "/")):
+            return True
+        return False
+
+    def scan(self) -> Dict[str, list]:
+        """扫描上下文目录，返回 {相对路径: [大小, 修改时间]}"""
+        files = {}
+        for root, dirs, names in os.walk(self.context):
+            relRoot = os.path.relpath(root, self.context).replace("\\", "/")
+            relRoot = "" if relRoot == "." else relRoot + "/"
+            dirs[:] = [d for d in dirs if not self._is_excluded(relRoot + d)]
+            for name in names:
+                rel = relRoot + name
+                if self._is_excluded(rel):
+                    continue
+                try:
+                    stat = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                files[rel] = [stat.st_size, stat.st_mtime_ns]
+        return files
+
+    def diff(self, current: Dict[str, list], previous: Dict[str, list]) -> Tuple[List[str], List[str]]:
+        """返回 (新增或修改的文件, 已删除的文件)"""
+        changed = sorted(rel for rel, sig in current.items() if previous.get(rel) != sig)
+        deleted = sorted(rel for rel in previous if rel not in current)
+        return changed, deleted
+
+    def _volume_exists(self) -> bool:
+        result = subprocess.run(["docker", "volume", "inspect", self.volume], capture_output=True)
+        return result.returncode == 0
+
+    def push(self) -> bool:
+        """以 tar 流把变化的文件推送到卷中，并删除宿主机上已删除的文件"""
+        if self._volume_exists():
+            previous = self._load_manifest()
+        else:
+            print(f"创建源码卷: {self.volume}")
+            subprocess.run(["docker", "volume", "create", self.volume], check=True, capture_output=True)
+            previous = {}
+
+        current = self.scan()
+        changed, deleted = self.diff(current, previous)
+        print(f"同步源码到卷 {self.volume}: {len(changed)} 个文件变化, {len(deleted)} 个文件删除, "
+              f"{len(current) - len(changed)} 个文件未变化")
+        if not changed and not deleted:
+            return True
+
+        script = (
+            f"tar -xf - -C {CONTAINER_WORKSPACE} && cd {CONTAINER_WORKSPACE} && "
+            f"if [ -f {DELETED_LIST_NAME} ]; then xargs -0 rm -f -- < {DELETED_LIST_NAME}; rm -f {DELETED_LIST_NAME}; fi"
+        )
+        process = subprocess.Popen(
+            ["docker", "run", "--rm", "-i", "-v", self.mount, "--entrypoint", "",
+             self.dockerImage, "sh", "-c", script],
+            stdin=subprocess.PIPE
+        )
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+                for rel in changed:
+                    tar.add(os.path.join(self.context, rel), arcname=rel, recursive=False)
+                if deleted:
+                    data = "\0".join(deleted).encode("utf-8")
+                    info = tarfile.TarInfo(DELETED_LIST_NAME)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+        finally:
+            process.stdin.close()
+        if process.wait() != 0:
+            print(f"❌ 源码同步失败，退出码: {process.returncode}")
+            return False
+        self._save_manifest(current)
+        return True
+
+    def _remove_stale(self, remote) -> int:
+        """删除宿主机 resultDir 中容器内已不存在的文件，与 push 的删除处理对应"""
+        removed = 0
+        resultPath = os.path.join(self.context, self.resultDir)
+        for root, dirs, names in os.walk(resultPath):
+            # os.walk 不进入指向目录的符号链接，它们出现在 dirs 中
+            for name in names + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.context).replace("\\", "/")
+                if rel not in remote:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def pull(self) -> bool:
+        """以 tar 流把 resultDir 中上次拉取后变化的文件取回宿主机上下文目录，并删除容器内已删除的文件"""
+        if not self.resultDir:
+            return True
+        full = not os.path.exists(os.path.join(self.context, self.resultDir))
+        # 先记录新的时间戳再查找变化的文件，构建期间的修改不会被漏掉；
+        # 完整文件列表放在 tar 流的第一项，用于找出需要删除的文件
+        script = (
+            f"cd {CONTAINER_WORKSPACE} && touch {PULL_STAMP_NAME}.new && "
+            f"find '{self.resultDir}' \\( -type f -o -type l \\) > {PULL_LIST_NAME} && "
+            f"if [ -f {PULL_STAMP_NAME} ] && [ {int(full)} = 0 ]; "
+            f"then find '{self.resultDir}' -newer {PULL_STAMP_NAME} \\( -type f -o -type l \\); "
+            f"else cat {PULL_LIST_NAME}; fi > /tmp/xbuild-pull.list && "
+            f"tar -cf - {PULL_LIST_NAME} -T /tmp/xbuild-pull.list && "
+            f"rm -f {PULL_LIST_NAME} && mv {PULL_STAMP_NAME}.new {PULL_STAMP_NAME}"
+        )
+        process = subprocess.Popen(
+            ["docker", "run", "--rm", "-v", self.mount, "--entrypoint", "",
+             self.dockerImage, "sh", "-c", script],
+            stdout=subprocess.PIPE
+        )
+        count = 0
+        remote = None
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                for member in tar:
+                    if member.name == PULL_LIST_NAME:
+                        remote = set(tar.extractfile(member).read().decode("utf-8").splitlines())
+                        continue
+                    if not member.name.startswith(self.resultDir + "/"):
+                        continue
+                    if hasattr(tarfile, "data_filter"):
+                        tar.extract(member, self.context, filter="data")
+                    else:
+                        tar.extract(member, self.context)
+                    count += 1
+        except (tarfile.ReadError, OSError) as e:
+            # 例如容器内没有 resultDir 时 find 失败，tar 流为空
+            print(f"❌ 成果物拉取失败: {e}")
+            return False
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            print(f"❌ 成果物拉取失败，退出码: {process.returncode}")
+            return False
+        removed = self._remove_stale(remote) if remote is not None else 0
+        print(f"从卷 {self.volume} 拉取成果物: {count} 个文件, 删除 {removed} 个已不存在的文件")
+        return True
@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import uuid
+import gzip
+import shutil
+import hashlib
+import tarfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PACKAGE_ROOT = "package"
+LATEST_MANIFEST_NAME = "manifest.json"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _HashingReader:
+    """读取文件的同时计算 sha256，避免为新文件额外读一遍"""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.digest.update(data)
+        return data
+
+
+class _HashingWriter:
+    """写出压缩包的同时计算整个包的 sha256"""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+class _CompressedStream:
+    """多线程压缩输出：优先 zstandard 模块，其次 zstd/pigz 命令，最后退回单线程 gzip"""
+
+    def __init__(self, path_base: str):
+        if zstandard is not None:
+            self.path = path_base + ".tar.zst"
+            self.method = "zstandard"
+        elif shutil.which("zstd"):
+            self.path = path_base + ".tar.zst"
+            self.method = "zstd"
+        elif shutil.which("pigz"):
+            self.path = path_base + ".tar.gz"
+            self.method = "pigz"
+        else:
+            self.path = path_base + ".tar.gz"
+            self.method = "gzip"
+        self._file = None
+        self.created = False
+        self.process = None
+        self._compressor = None
+        self.output = None
+        self.writer = None
+
+    def __enter__(self):
+        # 独占创建，已存在同名压缩包时直接报错，绝不覆盖已发布的包
+        self._file = open(self.path, "xb")
+        self.created = True
+        self.output = _HashingWriter(self._file)
+        if self.method == "zstandard":
+            self._compressor = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(
+                self.output, closefd=False)
+            self.writer = self._compressor
+        elif self.method in ("zstd", "pigz"):
+            cmd = ["zstd", "-T0", "-3", "-q", "-c"] if self.method == "zstd" else ["pigz", "-c"]
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.writer = self.process.stdin
+        else:
+            self._compressor = gzip.GzipFile(fileobj=self.output, mode="wb", compresslevel=6)
+            self.writer = self._compressor
+        return self
+
+    def pump(self):
+        """外部压缩命令时，把压缩后的输出拷贝到文件"""
+        for chunk in iter(lambda: self.process.stdout.read(CHUNK_SIZE), b""):
+            self.output.write(chunk)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._compressor is not None:
+                self._compressor.close()
+        finally:
+            self._file.close()
+        return False
+
+
+class ArtifactPackager:
+    """将成果物目录以流式方式打包成多线程压缩的 tar，未变化的文件与上一次打包去重
+
+    指定 files 时只打包其中位于 sourceDir 下的路径，否则打包整个目录
+    """
+
+    def __init__(self, project, sourceDir, outputDir=None, files=None):
+        self.project = project
+        self.sourceDir = os.path.abspath(sourceDir)
+        self.files = None if files is None else sorted({os.path.abspath(path) for path in files})
+        self.outputDir = os.path.abspath(outputDir or os.path.join(PACKAGE_ROOT, project))
+        self.latestManifest = os.path.join(self.outputDir, LATEST_MANIFEST_NAME)
+        self._packageExists: Dict[str, bool] = {}
+
+    def _load_previous(self) -> Dict[str, Dict]:
+        try:
+            with open(self.latestManifest, "r") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _has_package(self, packageName) -> bool:
+        if packageName not in self._packageExists:
+            self._packageExists[packageName] = os.path.isfile(os.path.join(self.outputDir, packageName))
+        return self._packageExists[packageName]
+
+    def _walk(self):
+        """返回 (相对路径, 路径, 类型)，类型为 file、symlink 或 dir（只包含空目录）"""
+        if self.files is not None:
+            for path in self.files:
+                rel = os.path.relpath(path, self.sourceDir).replace("\\", "/")
+                if rel.startswith("../"):
+                    continue
+                if os.path.islink(path):
+                    yield rel, path, "symlink"
+                elif os.path.isfile(path):
+                    yield rel, path, "file"
+            return
+        for root, dirs, names in os.walk(self.sourceDir):
+            dirs.sort()
+            if root != self.sourceDir and not dirs and not names:
+                yield os.path.relpath(root, self.sourceDir).replace("\\", "/"), root, "dir"
+            # os.walk 不进入指向目录的符号链接，它们出现在 dirs 中
+            for name in sorted(names + [d for d in dirs if os.path.islink(os.path.join(root, d))]):
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.sourceDir).replace("\\", "/")
+                if os.path.islink(path):
+                    yield rel, path, "symlink"
+                elif os.path.isfile(path):
+                    yield rel, path, "file"
+
+    def _add_files(self, tar, packageName, previous, files, stats):
+        for rel, path, kind in self._walk():
+            if kind != "file":
+                # 符号链接和空目录只有 tar 头，每次都写入本次的包
+                stat = os.lstat(path)
+                tar.addfile(tar.gettarinfo(path, arcname=rel))
+                entry = {"type": kind, "mtime_ns": stat.st_mtime_ns, "package": packageName}
+                if kind == "symlink":
+                    entry["target"] = os.readlink(path)
+                files[rel] = entry
+                stats["links" if kind == "symlink" else "dirs"] += 1
+                continue
+
+            stat = os.stat(path)
+            prev = previous.get(rel)
+            if prev and (prev.get("type", "file") != "file" or not self._has_package(prev["package"])):
+                # 上次不是普通文件，或记录的压缩包已被删除，重新存入本次的包
+                prev = None
+            entry = {"type": "file", "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if prev and prev["size"] == stat.st_size and prev["mtime_ns"] == stat.st_mtime_ns:
+                # 大小和修改时间都未变，直接沿用上一次的校验和与存放位置
+                entry.update(sha256=prev["sha256"], package=prev["package"])
+                stats["reused"] += 1
+            elif prev and prev["size"] == stat.st_size and _file_sha256(path) == prev["sha256"]:
+                entry.update(sha256=prev["sha256"], package=prev["package"])
+                stats["reused"] += 1
+            else:
+                info = tar.gettarinfo(path, arcname=rel)
+                with open(path, "rb") as f:
+                    reader = _HashingReader(f)
+                    tar.addfile(info, reader)
+                entry.update(sha256=reader.digest.hexdigest(), package=packageName)
+                stats["added"] += 1
+                stats["bytes"] += stat.st_size
+            files[rel] = entry
+
+    def _write_archive(self, stream, packageName, previous, files, stats) -> bool:
+        with stream:
+            if stream.process is None:
+                with tarfile.open(fileobj=stream.writer, mode="w|") as tar:
+                    self._add_files(tar, packageName, previous, files, stats)
+                return True
+            # 外部压缩进程的输出需要并发读取，否则管道写满后会阻塞
+            pumper = threading.Thread(target=stream.pump)
+            pumper.start()
+            try:
+                with tarfile.open(fileobj=stream.writer, mode="w|") as tar:
+                    self._add_files(tar, packageName, previous, files, stats)
+            finally:
+                stream.writer.close()
+                pumper.join()
+                returnCode = stream.process.wait()
+            if returnCode != 0:
+                print(f"❌ 压缩命令失败，退出码: {returnCode}")
+                return False
+            return True
+
+    def package(self) -> Optional[str]:
+        """生成压缩包、内容清单和校验和清单，返回压缩包路径"""
+        if not os.path.isdir(self.sourceDir):
+            print(f"❌ 打包目录不存在: {self.sourceDir}")
+            return None
+        os.makedirs(self.outputDir, exist_ok=True)
+        previous = self._load_previous()
+        # 同一秒内的多次打包靠随机后缀区分
+        packageBase = f"{self.project}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        start = time.time()
+        files = {}
+        stats = {"added": 0, "reused": 0, "bytes": 0, "links": 0, "dirs": 0}
+
+        stream = _CompressedStream(os.path.join(self.outputDir, packageBase))
+        packageName = os.path.basename(stream.path)
+        print(f"打包 {self.sourceDir} -> {stream.path} ({stream.method})")
+        if os.path.exists(stream.path):
+            print(f"❌ 压缩包已存在，拒绝覆盖: {stream.path}")
+            return None
+        try:
+            written = self._write_archive(stream, packageName, previous, files, stats)
+        except Exception as e:
+            print(f"❌ 打包失败: {e}")
+            written = False
+        if not written:
+            # 不留下半成品压缩包；清单未更新，之前的包和清单保持不变
+            if stream.created and os.path.exists(stream.path):
+                os.remove(stream.path)
+            return None
+
+        manifest = {
+            "project": self.project,
+            "package": packageName,
+            "packageSha256": stream.output.digest.hexdigest(),
+            "created": time.time(),
+            "source": self.sourceDir,
+            "files": files,
+        }
+        manifestPath = os.path.join(self.outputDir, packageBase + ".manifest.json")
+        with open(manifestPath, "x") as f:
+            json.dump(manifest, f, indent=2)
+        shutil.copyfile(manifestPath, self.latestManifest)
+        # sha256sum 兼容格式，可在成果物目录中直接执行 sha256sum -c 校验
+        with open(os.path.join(self.outputDir, packageBase + ".sha256"), "x") as f:
+            for rel in sorted(files):
+                if files[rel].get("type", "file") == "file":
+                    f.write(f"{files[rel]['sha256']}  {rel}\n")
+
+        print(f"✅ 打包完成: 新增/变化 {stats['added']} 个文件 ({stats['bytes'] / 1024 ** 2:.1f} MB)，"
+              f"与上次打包去重 {stats['reused']} 个文件，符号链接 {stats['links']} 个，空目录 {stats['dirs']} 个，"
+              f"用时 {time.time() - start:.1f}s")
+        return stream.path
+
+
+@contextmanager
+def _open_archive(path: str):
+    """以流的方式解压压缩包，返回可供 tarfile 读取的文件对象"""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield f
+    elif zstandard is not None:
+        with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            yield reader
+    elif shutil.which("zstd"):
+        process = subprocess.Popen(["zstd", "-d", "-q", "-c", path], stdout=subprocess.PIPE)
+        try:
+            yield process.stdout
+        finally:
+            process.stdout.close()
+            process.wait()
+    else:
+        raise RuntimeError(f"无法解压 {path}: 需要 zstandard 模块或 zstd 命令")
+
+
+def _restore_path(destDir: str, rel: str) -> str:
+    target = os.path.normpath(os.path.join(destDir, rel))
+    if os.path.isabs(rel) or os.path.commonpath([destDir, target]) != destDir:
+        raise ValueError(f"清单中的路径越出目标目录: {rel}")
+    return target
+
+
+def restore_package(project: str, destDir: str, manifestPath: Optional[str] = None,
+                    outputDir: Optional[str] = None) -> bool:
+    """按清单从各次打包的压缩包中取出文件，在 destDir 下还原完整的成果物目录
+
+    默认使用最近一次的清单，也可指定某次打包的 <包名>.manifest.json
+    """
+    outputDir = os.path.abspath(outputDir or os.path.join(PACKAGE_ROOT, project))
+    manifestPath = manifestPath or os.path.join(outputDir, LATEST_MANIFEST_NAME)
+    try:
+        with open(manifestPath, "r") as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ 无法读取清单 {manifestPath}: {e}")
+        return False
+
+    byPackage: Dict[str, Dict[str, Dict]] = {}
+    others = []
+    for rel, entry in files.items():
+        if entry.get("type", "file") == "file":
+            byPackage.setdefault(entry["package"], {})[rel] = entry
+        else:
+            others.append((rel, entry))
+    missing = [name for name in byPackage if not os.path.isfile(os.path.join(outputDir, name))]
+    if missing:
+        print(f"❌ 清单引用的压缩包不存在: {missing}")
+        return False
+
+    destDir = os.path.abspath(destDir)
+    os.makedirs(destDir, exist_ok=True)
+    start = time.time()
+    for packageName, wanted in sorted(byPackage.items()):
+        remaining = set(wanted)
+        print(f"还原 {len(wanted)} 个文件: {packageName}")
+        with _open_archive(os.path.join(outputDir, packageName)) as stream, \
+                tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                entry = wanted.get(member.name)
+                if entry is None or not member.isfile():
+                    continue
+                target = _restore_path(destDir, member.name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as src, open(target, "wb") as dst:
+                    reader = _HashingReader(src)
+                    shutil.copyfileobj(reader, dst, CHUNK_SIZE)
+                if reader.digest.hexdigest() != entry["sha256"]:
+                    print(f"❌ 校验和不匹配: {member.name} ({packageName})")
+                    return False
+                os.chmod(target, member.mode)
+                os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+                remaining.discard(member.name)
+        if remaining:
+            print(f"❌ 压缩包 {packageName} 中缺少文件: {sorted(remaining)}")
+            return False
+
+    # 普通文件还原完成后再创建空目录和符号链接，避免文件经由链接写到目标目录之外
+    for rel, entry in sorted(others):
+        target = _restore_path(destDir, rel)
+        if entry["type"] == "dir":
+            os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.lexists(target):
+                os.remove(target)
+            os.symlink(entry["target"], target)
+        if os.utime in os.supports_follow_symlinks:
+            os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]), follow_symlinks=False)
+
+    print(f"✅ 已还原 {len(files)} 个条目到 {destDir}，涉及 {len(byPackage)} 个压缩包，"
+          f"用时 {time.time() - start:.1f}s")
+    return True
@@ -0,0 +1,308 @@
+import os
+import re
+import csv
+import json
+import time
+import threading
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from common.common import STATE_DIR
+
+RESOURCE_ROOT = os.path.join(STATE_DIR, "resources")
+DEFAULT_INTERVAL = 1.0
+SAMPLE_FIELDS = ["project", "phase", "timestamp", "elapsed", "processes", "rss_bytes",
+                 "cpu_percent", "cpu_seconds", "read_bytes", "write_bytes"]
+
+_SIZE_UNITS = {
+    "b": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+    "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4,
+}
+
+
+def _parse_size(text: str) -> int:
+    """解析 docker stats 输出的大小，例如 12.5MiB、3.4GB"""
+    match = re.match(r"\s*([\d.]+)\s*([a-zA-Z]*)", text)
+    if not match:
+        return 0
+    return int(float(match.group(1)) * _SIZE_UNITS.get(match.group(2).lower(), 1))
+
+
+def _read_proc_stat(pid: str) -> Optional[tuple]:
+    """返回 (ppid, rss 页数, 自身及已回收子进程的 CPU 时钟数)"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # 进程名可能包含空格和括号，从最后一个 ')' 之后开始解析
+    fields = data[data.rfind(")") + 2:].split()
+    ppid = int(fields[1])
+    ticks = int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+    rss_pages = int(fields[21])
+    return ppid, rss_pages, ticks
+
+
+def _read_proc_io(pid: str) -> Optional[tuple]:
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            values = dict(line.split(": ", 1) for line in f.read().splitlines() if ": " in line)
+    except OSError:
+        return None
+    return int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0))
+
+
+def wait_process(process) -> Tuple[int, Optional[object]]:
+    """等待子进程结束，返回 (退出码, rusage)；平台不支持 wait4 时 rusage 为 None"""
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        return process.wait(), None
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return process.wait(), None
+    # 进程已被回收，设置 returncode 后 Popen 不会再次 waitpid
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage
+
+
+class _Sampler:
+    """在后台线程中周期性采样一个进程树或一个容器"""
+
+    def __init__(self, recorder, project, phase):
+        self.recorder = recorder
+        self.project = project
+        self.phase = phase
+        self.pid = None
+        self.container = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+        self._last_time = None
+        self._samples: List[Dict] = []
+        self._exit_usages = []
+        self._peak_rss = 0
+        self._cpu_seconds = 0.0
+        self._read_bytes = 0
+        self._write_bytes = 0
+
+    def __enter__(self):
+        self._start = time.time()
+        self._last_time = self._start
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._exit_usages:
+            self._apply_usages(self._exit_usages)
+        self.recorder._finish(self, time.time() - self._start)
+        return False
+
+    def attach_pid(self, pid: int):
+        """跟踪以 pid 为根的整个进程树（依赖 /proc）"""
+        if not os.path.isdir("/proc"):
+            return
+        self.pid = str(pid)
+        self._start_thread()
+
+    def attach_container(self, name: str):
+        """通过 docker stats 跟踪容器"""
+        self.container = name
+        self._start_thread()
+
+    def record_exit(self, usage):
+        """记录根进程退出时的 rusage，补上最后一次采样之后以及短于采样间隔的阶段的用量"""
+        if usage is not None:
+            self._exit_usages.append(usage)
+
+    def _apply_usages(self, usages):
+        # rusage 已包含根进程回收的全部子孙进程，同一阶段先后执行的多个命令累加；
+        # ru_maxrss 以 KB 计，inblock/oublock 以 512 字节块计
+        self._cpu_seconds = max(self._cpu_seconds, sum(u.ru_utime + u.ru_stime for u in usages))
+        self._peak_rss = max(self._peak_rss, max(u.ru_maxrss for u in usages) * 1024)
+        self._read_bytes = max(self._read_bytes, sum(u.ru_inblock for u in usages) * 512)
+        self._write_bytes = max(self._write_bytes, sum(u.ru_oublock for u in usages) * 512)
+
+    def _start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._sample()
+            except Exception:
+                pass
+            if self._stop.wait(self.recorder.interval):
+                break
+
+    def _process_tree(self) -> Dict[str, tuple]:
+        stats = {}
+        children: Dict[str, List[str]] = {}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            stat = _read_proc_stat(pid)
+            if stat:
+                stats[pid] = stat
+                children.setdefault(str(stat[0]), []).append(pid)
+        tree = {}
+        pending = [self.pid]
+        while pending:
+            pid = pending.pop()
+            if pid in stats and pid not in tree:
+                tree[pid] = stats[pid]
+                pending.extend(children.get(pid, []))
+        return tree
+
+    def _sample(self):
+        now = time.time()
+        if self.container:
+            sample = self._sample_container(now)
+        else:
+            sample = self._sample_process_tree(now)
+        if sample is None:
+            return
+        self._last_time = now
+        self.recorder._add_sample(self, sample)
+
+    def _sample_process_tree(self, now):
+        tree = self._process_tree()
+        if not tree:
+            return None
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        ticks_per_second = os.sysconf("SC_CLK_TCK")
+        rss = sum(stat[1] for stat in tree.values()) * page_size
+        # 存活进程的 CPU 时间已包含其已回收的子孙进程，求和不会重复计算
+        cpu = max(self._cpu_seconds, sum(stat[2] for stat in tree.values()) / ticks_per_second)
+        # 与 CPU 时间相同，内核会把已回收子进程的 IO 计数累加到父进程的 /proc/<pid>/io，
+        # 只对存活进程求和即可；未被及时回收的进程退出时读数可能短暂回落，取历史最大值
+        ios = [io for io in (_read_proc_io(pid) for pid in tree) if io]
+        read_bytes = max(self._read_bytes, sum(io[0] for io in ios))
+        write_bytes = max(self._write_bytes, sum(io[1] for io in ios))
+        return self._build_sample(now, len(tree), rss, cpu, read_bytes, write_bytes)
+
+    def _sample_container(self, now):
+        result = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{json .}}", self.container],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        stats = json.loads(result.stdout.strip().splitlines()[0])
+        rss = _parse_size(stats.get("MemUsage", "0B").split("/")[0])
+        cpu_percent = float(stats.get("CPUPerc", "0%").rstrip("%") or 0)
+        block_io = stats.get("BlockIO", "0B / 0B").split("/")
+        cpu = self._cpu_seconds + cpu_percent / 100 * (now - self._last_time)
+        pids = int(stats.get("PIDs", "0") or 0)
+        sample = self._build_sample(now, pids, rss, cpu, _parse_size(block_io[0]), _parse_size(block_io[-1]))
+        sample["cpu_percent"] = round(cpu_percent, 1)
+        return sample
+
+    def _build_sample(self, now, processes, rss, cpu, read_bytes, write_bytes):
+        elapsed = now - self._last_time
+        cpu_percent = (cpu - self._cpu_seconds) / elapsed * 100 if elapsed > 0 else 0.0
+        self._cpu_seconds = cpu
+        self._read_bytes = read_bytes
+        self._write_bytes = write_bytes
+        return {
+            "project": self.project,
+            "phase": self.phase,
+            "timestamp": round(now, 3),
+            "elapsed": round(now - self._start, 3),
+            "processes": processes,
+            "rss_bytes": rss,
+            "cpu_percent": round(cpu_percent, 1),
+            "cpu_seconds": round(cpu, 3),
+            "read_bytes": read_bytes,
+            "write_bytes": write_bytes,
+        }
+
+
+class _NullSampler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def attach_pid(self, pid):
+        pass
+
+    def attach_container(self, name):
+        pass
+
+    def record_exit(self, usage):
+        pass
+
+
+def track(recorder, project: str, phase: str):
+    """为一个构建阶段创建采样器，recorder 为 None 时不做任何事"""
+    if recorder is None:
+        return _NullSampler()
+    return _Sampler(recorder, project, phase)
+
+
+class ResourceRecorder:
+    """汇总一次构建运行中各项目、各阶段的资源使用情况"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or DEFAULT_INTERVAL
+        self.started = time.time()
+        self.samples: List[Dict] = []
+        self.phases: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _add_sample(self, sampler, sample):
+        with self._lock:
+            sampler._samples.append(sample)
+            self.samples.append(sample)
+
+    def _finish(self, sampler, duration):
+        with self._lock:
+            samples = sampler._samples
+            # 平均值按累计 CPU 时间计算，不依赖采样次数
+            avg_cpu = sampler._cpu_seconds / duration * 100 if duration > 0 else 0.0
+            self.phases.append({
+                "project": sampler.project,
+                "phase": sampler.phase,
+                "duration": round(duration, 3),
+                "samples": len(samples),
+                "peak_rss_bytes": max(max((s["rss_bytes"] for s in samples), default=0), sampler._peak_rss),
+                "avg_cpu_percent": round(avg_cpu, 1),
+                "peak_cpu_percent": max(max((s["cpu_percent"] for s in samples), default=0.0), round(avg_cpu, 1)),
+                "cpu_seconds": round(sampler._cpu_seconds, 3),
+                "read_bytes": sampler._read_bytes,
+                "write_bytes": sampler._write_bytes,
+            })
+
+    def print_summary(self):
+        if not self.phases:
+            return
+        print("Resource usage summary:")
+        print(f"  {'project':<24} {'phase':<16} {'time(s)':>8} {'peak RSS(MB)':>12} "
+              f"{'avg CPU%':>8} {'peak CPU%':>9} {'read(MB)':>9} {'write(MB)':>9}")
+        for phase in self.phases:
+            print(f"  {phase['project']:<24} {phase['phase']:<16} {phase['duration']:>8.1f} "
+                  f"{phase['peak_rss_bytes'] / 1024 ** 2:>12.1f} {phase['avg_cpu_percent']:>8.1f} "
+                  f"{phase['peak_cpu_percent']:>9.1f} {phase['read_bytes'] / 1024 ** 2:>9.1f} "
+                  f"{phase['write_bytes'] / 1024 ** 2:>9.1f}")
+
+    def export(self) -> Optional[str]:
+        """导出 summary.json、samples.json 和 samples.csv，返回输出目录"""
+        if not self.phases:
+            return None
+        output_dir = os.path.join(RESOURCE_ROOT, time.strftime("run-%Y%m%d-%H%M%S", time.localtime(self.started)))
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "summary.json"), "w") as f:
+            json.dump({"started": self.started, "finished": time.time(), "phases": self.phases}, f, indent=2)
+        with open(os.path.join(output_dir, "samples.json"), "w") as f:
+            json.dump(self.samples, f)
+        with open(os.path.join(output_dir, "samples.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SAMPLE_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.samples)
+        print(f"Resource samples written to: {output_dir}")
+        return output_dir
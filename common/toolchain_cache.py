@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+from typing import Dict, Optional
+
+from common.common import STATE_DIR
+
+TOOLCHAIN_CACHE_ROOT = os.path.join(STATE_DIR, "toolchains")
+INITIAL_CACHE_NAME = "InitialCache.cmake"
+STAMP_NAME = "stamp.json"
+
+# 与项目无关、只取决于工具链的缓存项：编译器及配套工具路径
+TOOL_ENTRY_PATTERN = re.compile(
+    r"^CMAKE_(\w+_COMPILER(_AR|_RANLIB)?|AR|RANLIB|LINKER|NM|OBJCOPY|OBJDUMP|STRIP|READELF|ADDR2LINE|DLLTOOL)$"
+)
+# 不缓存 check_*/try_compile 结果（HAVE_*、SIZEOF_* 等）：它们取决于项目自身的
+# 包含目录、编译选项和 CMAKE_REQUIRED_*，跨项目复用会得到错误结果
+CACHE_ENTRY_PATTERN = re.compile(r"^([^#/][^:=]*):([A-Z]+)=(.*)$")
+# CMakeFiles/<ver>/CMake<LANG>Compiler.cmake 中记录的编译器绝对路径
+COMPILER_FILE_PATTERN = re.compile(r'^set\(CMAKE_\w+_COMPILER "([^"]+)"\)', re.MULTILINE)
+
+# 并行构建的项目可能共用同一工具链，按缓存目录串行化读写
+_CACHE_LOCKS: Dict[str, threading.RLock] = {}
+_CACHE_LOCKS_GUARD = threading.Lock()
+
+
+def _cache_lock(cacheDir: str) -> threading.RLock:
+    with _CACHE_LOCKS_GUARD:
+        return _CACHE_LOCKS.setdefault(cacheDir, threading.RLock())
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_signature(path: str) -> Optional[list]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _cmake_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("$", "\\$")
+
+
+def read_cmake_cache(cache_path: str) -> Dict[str, tuple]:
+    """解析 CMakeCache.txt，返回 {名称: (类型, 值)}"""
+    entries = {}
+    with open(cache_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = CACHE_ENTRY_PATTERN.match(line.rstrip("\r\n"))
+            if match:
+                entries[match.group(1)] = (match.group(2), match.group(3))
+    return entries
+
+
+def get_cmake_version() -> Optional[str]:
+    try:
+        output = subprocess.run(["cmake", "--version"], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = re.search(r"cmake version (\S+)", output)
+    return match.group(1) if match else None
+
+
+def _identified_compilers(platformDir: str) -> Dict[str, list]:
+    """从编译器识别结果中取出各语言编译器的路径和签名
+
+    工具链文件通常以普通变量设置 CMAKE_<LANG>_COMPILER，不会出现在 CMakeCache.txt 中
+    """
+    compilers = {}
+    for name in sorted(os.listdir(platformDir)):
+        if not (name.startswith("CMake") and name.endswith("Compiler.cmake")):
+            continue
+        with open(os.path.join(platformDir, name), "r", encoding="utf-8", errors="replace") as f:
+            for path in COMPILER_FILE_PATTERN.findall(f.read()):
+                signature = _file_signature(path)
+                if signature:
+                    compilers[path] = signature
+    return compilers
+
+
+class ToolchainCache:
+    """按工具链缓存 CMake 编译器识别结果和工具路径，用于初始化新的构建目录"""
+
+    def __init__(self, toolchainFile, name):
+        self.toolchainFile = str(toolchainFile)
+        self.cacheDir = os.path.abspath(os.path.join(TOOLCHAIN_CACHE_ROOT, name))
+        self.initialCache = os.path.join(self.cacheDir, INITIAL_CACHE_NAME)
+        self.stampFile = os.path.join(self.cacheDir, STAMP_NAME)
+        self._cmakeVersion = None
+        self._lock = _cache_lock(self.cacheDir)
+
+    def _current_cmake_version(self):
+        if self._cmakeVersion is None:
+            self._cmakeVersion = get_cmake_version()
+        return self._cmakeVersion
+
+    def is_valid(self) -> bool:
+        """工具链文件、编译器或 CMake 版本变化时缓存失效"""
+        try:
+            with open(self.stampFile, "r") as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not os.path.exists(self.initialCache):
+            return False
+        if stamp.get("toolchainSha256") != _file_sha256(self.toolchainFile):
+            return False
+        if stamp.get("cmakeVersion") != self._current_cmake_version():
+            return False
+        if not stamp.get("compilers"):
+            return False
+        for path, signature in stamp.get("compilers", {}).items():
+            if _file_signature(path) != signature:
+                return False
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            if os.path.exists(self.cacheDir):
+                print(f"工具链缓存已失效，删除: {self.cacheDir}")
+                shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+    def seed(self, buildDir) -> Optional[str]:
+        """为全新构建目录预置编译器识别结果，返回传给 cmake -C 的初始缓存文件"""
+        if os.path.exists(os.path.join(buildDir, "CMakeCache.txt")):
+            return None
+        with self._lock:
+            if not self.is_valid():
+                self.invalidate()
+                return None
+            platformDir = os.path.join(self.cacheDir, "CMakeFiles")
+            if os.path.isdir(platformDir):
+                shutil.copytree(platformDir, os.path.join(buildDir, "CMakeFiles"), dirs_exist_ok=True)
+        print(f"使用工具链缓存初始化构建目录: {self.initialCache}")
+        return self.initialCache
+
+    def capture(self, buildDir):
+        """从已成功配置的构建目录中提取与工具链相关的缓存项"""
+        with self._lock:
+            self._capture(buildDir)
+
+    def _capture(self, buildDir):
+        if self.is_valid():
+            return
+        cachePath = os.path.join(buildDir, "CMakeCache.txt")
+        if not os.path.exists(cachePath):
+            return
+        entries = read_cmake_cache(cachePath)
+        version = self._current_cmake_version()
+        platformDir = os.path.join(buildDir, "CMakeFiles", version or "")
+        if not version or not os.path.exists(os.path.join(platformDir, "CMakeSystem.cmake")):
+            return
+
+        compilers = _identified_compilers(platformDir)
+        if not compilers:
+            # 无法记录编译器签名时就无法发现编译器升级，宁可不缓存
+            print("未能确定编译器路径，不保存工具链缓存")
+            return
+
+        lines = ["# 由 x-build 自动生成，记录工具链相关的编译器识别结果\n"]
+        for name, (entryType, value) in sorted(entries.items()):
+            if name == "CMAKE_PLATFORM_INFO_INITIALIZED" and entryType == "INTERNAL":
+                lines.append(f'set({name} "{_cmake_escape(value)}" CACHE INTERNAL "")\n')
+            elif TOOL_ENTRY_PATTERN.match(name) and value and not value.endswith("-NOTFOUND"):
+                lines.append(f'set({name} "{_cmake_escape(value)}" CACHE {entryType} "")\n')
+                if name.endswith("_COMPILER") and _file_signature(value):
+                    compilers[os.path.abspath(value)] = _file_signature(value)
+
+        # 先写入临时目录再整体替换，避免其他进程读到半成品；目录名带线程号，进程内并发由锁保证
+        tmpDir = f"{self.cacheDir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        shutil.copytree(platformDir, os.path.join(tmpDir, "CMakeFiles", version),
+                        ignore=shutil.ignore_patterns("CompilerId*"))
+        with open(os.path.join(tmpDir, INITIAL_CACHE_NAME), "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        with open(os.path.join(tmpDir, STAMP_NAME), "w") as f:
+            json.dump({
+                "toolchainFile": self.toolchainFile,
+                "toolchainSha256": _file_sha256(self.toolchainFile),
+                "cmakeVersion": version,
+                "compilers": compilers,
+            }, f, indent=2)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+        try:
+            os.replace(tmpDir, self.cacheDir)
+            print(f"已保存工具链缓存: {self.cacheDir}")
+        except OSError:
+            shutil.rmtree(tmpDir, ignore_errors=True)
@@ -1,9 +1,16 @@
 import os
 import sys
+import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Callable
 from pathlib import Path
 from common.common import ConfigManager
+from common.build_log import BuildLog, load_index, read_log_lines, read_diagnostics
+from common.resource_sampler import ResourceRecorder
+from common.build_history import BuildHistory, plan_builds
+from common.packager import restore_package
+from builders.ctest_runner import CTestRunner
 from builders.cmake_builder import CMakeBuilder
 from builders.user_builder import UserBuilder
 from builders.docker_builder import DockerBuilder
@@ -38,7 +45,9 @@ def clean_build_directory(clear_dir):
         return False
 
 def handle_help():
-    print("Usage: build.exe [clean <project_name> | clean]")
+    print("Usage: build.exe [clean <project_name> | clean | logs <project_name> [--errors] [--run N] | "
+          "test [<project_name> ...] [--rerun-failed] [-j N] | plan [<project_name> ...] | "
+          "unpack <project_name> <dest_dir> [--manifest FILE]]")
 
 def handle_dclean(config_manager: ConfigManager, args: List[str]):
     clear_dir = f"build"
@@ -59,44 +68,98 @@ def handle_clean(config_manager: ConfigManager, args: List[str]):
         else:
             print(f"No build directory to clean: {clear_dir}")
 
-def handle_build(config_manager: ConfigManager, args: List[str]):
-    for arg in args:
-        platform = config_manager.get_platform(arg)
-        print(f"platform: {platform}")
-        compiler = config_manager.get_compiler(arg)
-        print(f"compiler: {compiler}")
-        buildType = config_manager.get_type(arg)
-        print(f"type: {buildType}")
-        cflags = config_manager.get_cflags(arg)
-        print(f"cflags: {cflags}")
-        lflags = config_manager.get_lflags(arg)
-        print(f"lflags: {lflags}")
-        userBuildCmd = config_manager.get_userBuildCmd(arg)
-        print(f"userBuildCmd: {userBuildCmd}")
-        dockerfile = config_manager.get_dockerfile(arg)
-        print(f"dockerfile: {dockerfile}")
-        dockerImage = config_manager.get_dockerImage(arg)
-        print(f"dockerImage: {dockerImage}")
-        context = config_manager.get_context(arg)
-        print(f"context: {context}")
-        dockerBuildCmd = config_manager.get_dockerBuildCmd(arg)
-        print(f"dockerBuildCmd: {dockerBuildCmd}")
-        resultDir = config_manager.get_resultDir(arg)
-        print(f"resultDir: {resultDir}")
+def build_one_project(config_manager: ConfigManager, arg: str, recorder, history: BuildHistory,
+                      projectJobs: int = 1) -> bool:
+    """构建单个项目并记录耗时"""
+    platform = config_manager.get_platform(arg)
+    print(f"platform: {platform}")
+    compiler = config_manager.get_compiler(arg)
+    print(f"compiler: {compiler}")
+    buildType = config_manager.get_type(arg)
+    print(f"type: {buildType}")
+    cflags = config_manager.get_cflags(arg)
+    print(f"cflags: {cflags}")
+    lflags = config_manager.get_lflags(arg)
+    print(f"lflags: {lflags}")
+    userBuildCmd = config_manager.get_userBuildCmd(arg)
+    print(f"userBuildCmd: {userBuildCmd}")
+    dockerfile = config_manager.get_dockerfile(arg)
+    print(f"dockerfile: {dockerfile}")
+    dockerImage = config_manager.get_dockerImage(arg)
+    print(f"dockerImage: {dockerImage}")
+    context = config_manager.get_context(arg)
+    print(f"context: {context}")
+    dockerBuildCmd = config_manager.get_dockerBuildCmd(arg)
+    print(f"dockerBuildCmd: {dockerBuildCmd}")
+    resultDir = config_manager.get_resultDir(arg)
+    print(f"resultDir: {resultDir}")
+    linkMemoryMB = config_manager.get_linkMemoryMB(arg)
+    print(f"linkMemoryMB: {linkMemoryMB}")
+    contextSync = config_manager.get_contextSync(arg)
+    print(f"contextSync: {contextSync}")
+    runTests = config_manager.get_runTests(arg)
+    print(f"runTests: {runTests}")
+    package = config_manager.get_package(arg)
+    print(f"package: {package}")
+    packageDir = config_manager.get_packageDir(arg)
+    print(f"packageDir: {packageDir}")
+    retention = config_manager.get_logRetention()
+    start = time.time()
+    success = False
+    with BuildLog(arg, retention.get('maxRuns'), retention.get('maxSizeMB')) as log:
         if dockerfile:
             print(f"Building {arg} using dockerfile: {dockerfile}")
-            docker_builder = DockerBuilder(arg, dockerfile, dockerImage, context, dockerBuildCmd, resultDir)
-            docker_builder.build_project()
-            continue
+            docker_builder = DockerBuilder(arg, dockerfile, dockerImage, context, dockerBuildCmd, resultDir, log=log, contextSync=contextSync, recorder=recorder, package=package)
+            success = log.success = docker_builder.build_project()
         elif userBuildCmd:
             print(f"Building {arg} using user-defined build command")
-            user_builder = UserBuilder(arg, userBuildCmd)
-            user_builder.build_project()
-            continue
+            user_builder = UserBuilder(arg, userBuildCmd, log=log, recorder=recorder)
+            success = log.success = user_builder.build_project()
         else:
             print(f"Building {arg} for platform {platform}")
-            cmake_builder = CMakeBuilder(arg, platform, compiler, buildType, cflags, lflags)
-            cmake_builder.build_project()
+            cmake_builder = CMakeBuilder(arg, platform, compiler, buildType, cflags, lflags, linkMemoryMB, log=log, recorder=recorder, runTests=runTests, package=package, packageDir=packageDir, projectJobs=projectJobs)
+            success = log.success = cmake_builder.build_project()
+    history.record(arg, time.time() - start, bool(success))
+    return bool(success)
+
+def handle_build(config_manager: ConfigManager, args: List[str]):
+    sampling = config_manager.get_resourceSampling()
+    recorder = ResourceRecorder(sampling.get('interval')) if sampling.get('enabled') else None
+    history = BuildHistory()
+    jobs = config_manager.get_projectJobs()
+    order, predicted = plan_builds(args, history, config_manager.get_defaultBuildEstimate(), jobs,
+                                   config_manager.get_buildOrder() != "config")
+    if len(order) > 1:
+        print(f"Build order: {', '.join(project for project, _ in order)} "
+              f"(predicted wall time {predicted:.0f}s with {jobs} job(s))")
+    try:
+        if jobs <= 1:
+            for arg, _ in order:
+                build_one_project(config_manager, arg, recorder, history)
+        else:
+            # 线程池按提交顺序取任务，预计耗时最长的项目最先开始
+            concurrent = min(jobs, len(order))
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                list(executor.map(lambda item: build_one_project(config_manager, item[0], recorder, history,
+                                                                 concurrent), order))
+    finally:
+        if recorder:
+            recorder.print_summary()
+            recorder.export()
+
+def handle_plan(config_manager: ConfigManager, args: List[str]):
+    """打印预测的构建顺序和总耗时，不执行构建"""
+    if not args:
+        args = config_manager.get_all_config_names()
+    history = BuildHistory()
+    default = config_manager.get_defaultBuildEstimate()
+    jobs = config_manager.get_projectJobs()
+    order, predicted = plan_builds(args, history, default, jobs, config_manager.get_buildOrder() != "config")
+    print("Build plan:")
+    for index, (project, estimate) in enumerate(order, 1):
+        source = "history" if history.has_history(project) else "default"
+        print(f"  {index:>3}. {project:<32} {estimate:>8.1f}s ({source})")
+    print(f"Estimated total wall time: {predicted:.1f}s with {jobs} parallel project(s)")
 
 def handle_list(config_manager: ConfigManager, args: List[str]):
     """列出所有可用的项目配置"""
@@ -105,11 +168,98 @@ def handle_list(config_manager: ConfigManager, args: List[str]):
     for project in projects:
         print(f"  - {project}")
 
+def handle_logs(config_manager: ConfigManager, args: List[str]):
+    """查看项目的压缩构建日志，--errors 只显示错误/警告行"""
+    errors_only = False
+    run = None
+    project = None
+    i = 0
+    while i < len(args):
+        if args[i] == "--errors":
+            errors_only = True
+        elif args[i] == "--run" and i + 1 < len(args):
+            run = int(args[i + 1])
+            i += 1
+        else:
+            project = args[i]
+        i += 1
+    if not project:
+        print("Usage: build.exe logs <project_name> [--errors] [--run N]")
+        return
+
+    index = load_index(project, run)
+    if index is None:
+        print(f"No build log found for {project}" + (f" run {run}" if run else ""))
+        return
+    print(f"Build log: {index['path']} (run {index['run']})")
+    if errors_only:
+        count = 0
+        for diagnostic in read_diagnostics(index):
+            print(f"{diagnostic['line'] + 1}: [{diagnostic['kind']}] {diagnostic['text']}")
+            count += 1
+        print(f"{count} diagnostic line(s)")
+    else:
+        for line in read_log_lines(index):
+            print(line)
+
+def handle_test(config_manager: ConfigManager, args: List[str]):
+    """在已构建的 CMake 构建树中并行运行测试"""
+    rerun_failed = False
+    jobs = None
+    projects = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--rerun-failed":
+            rerun_failed = True
+        elif args[i] == "-j" and i + 1 < len(args):
+            jobs = int(args[i + 1])
+            i += 1
+        else:
+            projects.append(args[i])
+        i += 1
+    if not projects:
+        projects = config_manager.get_all_config_names()
+
+    all_passed = True
+    for project in projects:
+        build_dir = f"build/{project}"
+        if not os.path.isdir(build_dir):
+            print(f"No build directory for {project}, skipping tests")
+            continue
+        print(f"Testing {project}")
+        if not CTestRunner(project, build_dir, jobs).run(rerun_failed):
+            all_passed = False
+    if not all_passed:
+        raise RuntimeError("Some tests failed")
+
+def handle_unpack(config_manager: ConfigManager, args: List[str]):
+    """根据打包清单把各次增量压缩包还原成完整的成果物目录"""
+    manifest = None
+    positional = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--manifest" and i + 1 < len(args):
+            manifest = args[i + 1]
+            i += 1
+        else:
+            positional.append(args[i])
+        i += 1
+    if len(positional) != 2:
+        print("Usage: build.exe unpack <project_name> <dest_dir> [--manifest FILE]")
+        return
+    project, dest_dir = positional
+    if not restore_package(project, dest_dir, manifest):
+        raise RuntimeError(f"Failed to unpack {project}")
+
 # 创建命令映射字典
 COMMAND_HANDLERS: Dict[str, Callable] = {
     "dclean": handle_dclean,
     "clean": handle_clean,
     "list": handle_list,
+    "logs": handle_logs,
+    "plan": handle_plan,
+    "test": handle_test,
+    "unpack": handle_unpack,
     "help": lambda cm, args: handle_help(),
     "--help": lambda cm, args: handle_help(),
     "-h": lambda cm, args: handle_help(),